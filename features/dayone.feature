@@ -30,6 +30,16 @@ Feature: Dayone specific implementation details.
             1979-05-01 09:00 Being born hurts.
             """
 
+    Scenario: Writing binary plists into Dayone
+        Given we use the config "dayone_binary.yaml"
+        When we run "jrnl 01 may 1979: Being born hurts."
+        and we run "jrnl -until 1980"
+        Then the output should be
+            """
+            1979-05-01 09:00 Being born hurts.
+            """
+        and the journal should have 1 binary plist entry
+
     Scenario: Loading tags from a DayOne Journal
         Given we use the config "dayone.yaml"
         When we run "jrnl --tags"
@@ -75,3 +85,95 @@ Feature: Dayone specific implementation details.
         and the json output should contain entries.0.creator.generation_date
         and the json output should contain entries.0.creator.device_agent
         and "entries.0.creator.software_agent" in the json output should contain "jrnl"
+
+    Scenario: Editing DayOne entries
+        Given we use the config "dayone_editor.yaml"
+        When we run "jrnl -from 'feb 2013' --edit" and enter in the editor
+            """
+            # 044F3747A38546168B572C2E3F217FA2
+            [2013-05-17 11:39] This entry has been edited!
+
+            # 422BC895507944A291E6FC44FC6B8BFC
+            [2013-07-17 11:38] This entry is starred! *
+            """
+        and we run "jrnl -from 'feb 2013'"
+        Then the output should be
+            """
+            2013-05-17 11:39 This entry has been edited!
+
+            2013-07-17 11:38 This entry is starred!
+            """
+        and DayOne entry "044F3747A38546168B572C2E3F217FA2" should have the text "This entry has been edited!"
+        and DayOne entry "0BDDD6CDA43C4A9AA2681517CC35AD9D" should not exist
+        and DayOne entry "422BC895507944A291E6FC44FC6B8BFC" should have the text "This entry is starred!"
+
+    Scenario: Deleting a DayOne entry whose UUID differs in case from its file name
+        Given we use the config "dayone_editor.yaml"
+        When we replace "0BDDD6CDA43C4A9AA2681517CC35AD9D" with "0bddd6cda43c4a9aa2681517cc35ad9d" in DayOne entry "0BDDD6CDA43C4A9AA2681517CC35AD9D"
+        and we run "jrnl -from 'feb 2013' --edit" and enter in the editor
+            """
+            # 044F3747A38546168B572C2E3F217FA2
+            [2013-05-17 11:39] This entry has tags!
+
+            # 422BC895507944A291E6FC44FC6B8BFC
+            [2013-07-17 11:38] This entry is starred! *
+            """
+        Then DayOne entry "0BDDD6CDA43C4A9AA2681517CC35AD9D" should not exist
+        and the DayOne journal should have 3 entry files
+
+    Scenario: Saving unchanged DayOne entries from the editor keeps them
+        Given we use the config "dayone_editor.yaml"
+        When we run "jrnl 01 may 1979: Being born hurts."
+        and we run "jrnl -until 1980 --edit" and save the editor unchanged
+        and we run "jrnl -until 1980"
+        Then the output should be
+            """
+            1979-05-01 09:00 Being born hurts.
+            """
+        and the DayOne journal should have 5 entry files
+
+    Scenario: DayOne entries are not cached by default
+        Given we use the config "dayone.yaml"
+        When we run "jrnl -n 10"
+        Then we should get no error
+        and the DayOne cache should not exist
+
+    Scenario: Unchanged DayOne entries are read from the cache
+        Given we use the config "dayone_cache.yaml"
+        When we run "jrnl -until 1900"
+        and we replace "is starred!" with "is glowing!" in DayOne entry "422BC895507944A291E6FC44FC6B8BFC" keeping its modification time
+        and we run "jrnl -n 10"
+        Then the output should contain "This entry is starred!"
+        and the output should not contain "This entry is glowing!"
+        and the DayOne cache should have 4 entries
+
+    Scenario: DayOne entries with a new modification time are parsed again
+        Given we use the config "dayone_cache.yaml"
+        When we run "jrnl -until 1900"
+        and we replace "is starred!" with "is glowing!" in DayOne entry "422BC895507944A291E6FC44FC6B8BFC"
+        and we run "jrnl -n 10"
+        Then the output should contain "This entry is glowing!"
+
+    Scenario: DayOne entries with a new size are parsed again
+        Given we use the config "dayone_cache.yaml"
+        When we run "jrnl -until 1900"
+        and we replace "is starred!" with "is now shining" in DayOne entry "422BC895507944A291E6FC44FC6B8BFC" keeping its modification time
+        and we run "jrnl -n 10"
+        Then the output should contain "This entry is now shining"
+
+    Scenario: Deleted DayOne entries are pruned from the cache
+        Given we use the config "dayone_cache.yaml"
+        When we run "jrnl -until 1900"
+        and we delete DayOne entry "422BC895507944A291E6FC44FC6B8BFC"
+        and we run "jrnl -n 10"
+        Then the output should not contain "This entry is starred!"
+        and the DayOne cache should have 3 entries
+
+    Scenario: A corrupt DayOne cache is rebuilt
+        Given we use the config "dayone_cache.yaml"
+        When we run "jrnl -until 1900"
+        and we corrupt the DayOne cache
+        and we run "jrnl -n 10"
+        Then we should get no error
+        and the output should contain "This entry is starred!"
+        and the DayOne cache should have 4 entries
@@ -2,6 +2,8 @@ import os
 import shutil
 import sys
 
+import xdg.BaseDirectory
+
 CWD = os.getcwd()
 
 
@@ -28,6 +30,10 @@ def before_scenario(context, scenario):
     """Before each scenario, backup all config and journal test data."""
     # Clean up in case something went wrong
     clean_all_working_dirs()
+    # Keep caches written by jrnl out of the user's cache directory
+    cache_home = os.path.join(CWD, "features", "cache")
+    os.environ["XDG_CACHE_HOME"] = cache_home
+    xdg.BaseDirectory.xdg_cache_home = cache_home
     for folder in ("configs", "journals"):
         original = os.path.join("features", "data", folder)
         working_dir = os.path.join("features", folder)
@@ -103,7 +103,8 @@ def move_up_dir(context, path):
 
 @when('we open the editor and enter "{text}"')
 @when("we open the editor and enter nothing")
-def open_editor_and_enter(context, text=""):
+@when('we run "{command}" and enter in the editor')
+def open_editor_and_enter(context, text="", command="jrnl"):
     text = text or context.text or ""
 
     def _mock_editor_function(command):
@@ -120,7 +121,23 @@ def open_editor_and_enter(context, text=""):
         patch("subprocess.call", side_effect=_mock_editor_function), \
         patch("sys.stdin.isatty", return_value=True) \
     :
-        context.execute_steps('when we run "jrnl"')
+        context.execute_steps('when we run "{}"'.format(command))
+    # fmt: on
+
+
+@when('we run "{command}" and save the editor unchanged')
+def open_editor_and_save(context, command):
+    def _mock_editor_function(command):
+        context.editor_command = command
+        return command[-1]
+
+    # fmt: off
+    # see: https://github.com/psf/black/issues/664
+    with \
+        patch("subprocess.call", side_effect=_mock_editor_function), \
+        patch("sys.stdin.isatty", return_value=True) \
+    :
+        context.execute_steps('when we run "{}"'.format(command))
     # fmt: on
 
 
@@ -0,0 +1,97 @@
+import os
+import pickle
+import plistlib
+
+from behave import then, when
+from jrnl import DayOneJournal, install, util
+
+
+def dayone_journal_path(journal_name="default"):
+    config = util.load_config(install.CONFIG_FILE_PATH)
+    return config["journals"][journal_name]
+
+
+def dayone_cache_file(journal_name="default"):
+    journal = DayOneJournal.DayOne(journal=dayone_journal_path(journal_name))
+    return journal._cache_file()
+
+
+def dayone_entry_file(uuid, journal_name="default"):
+    return os.path.join(dayone_journal_path(journal_name), "entries", uuid + ".doentry")
+
+
+def replace_in_dayone_entry(old, new, uuid):
+    filename = dayone_entry_file(uuid)
+    with open(filename, "rb") as f:
+        data = f.read()
+    assert old.encode("utf-8") in data, data
+    with open(filename, "wb") as f:
+        f.write(data.replace(old.encode("utf-8"), new.encode("utf-8")))
+
+
+@when('we replace "{old}" with "{new}" in DayOne entry "{uuid}"')
+def change_dayone_entry(context, old, new, uuid):
+    replace_in_dayone_entry(old, new, uuid)
+
+
+@when(
+    'we replace "{old}" with "{new}" in DayOne entry "{uuid}" keeping its modification time'
+)
+def change_dayone_entry_keeping_mtime(context, old, new, uuid):
+    stat = os.stat(dayone_entry_file(uuid))
+    replace_in_dayone_entry(old, new, uuid)
+    os.utime(dayone_entry_file(uuid), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+@when('we delete DayOne entry "{uuid}"')
+def delete_dayone_entry(context, uuid):
+    os.remove(dayone_entry_file(uuid))
+
+
+@when("we corrupt the DayOne cache")
+def corrupt_dayone_cache(context):
+    with open(dayone_cache_file(), "wb") as f:
+        f.write(b"this is not a pickle")
+
+
+@then("the DayOne cache should not exist")
+def check_no_dayone_cache(context):
+    assert not os.path.exists(dayone_cache_file())
+
+
+@then("the DayOne cache should have {number:d} entries")
+def check_dayone_cache_entries(context, number):
+    with open(dayone_cache_file(), "rb") as f:
+        cached_plists = pickle.load(f)
+    assert len(cached_plists) == number, cached_plists.keys()
+
+
+@then("the DayOne journal should have {number:d} entry files")
+def check_dayone_entry_files(context, number):
+    entries_dir = os.path.join(dayone_journal_path(), "entries")
+    filenames = os.listdir(entries_dir)
+    assert len(filenames) == number, filenames
+
+
+@then("the journal should have {number:d} binary plist entries")
+@then("the journal should have {number:d} binary plist entry")
+def check_binary_plist_entries(context, number):
+    entries_dir = os.path.join(dayone_journal_path(), "entries")
+    binary_entries = []
+    for filename in os.listdir(entries_dir):
+        with open(os.path.join(entries_dir, filename), "rb") as f:
+            if f.read(8) == b"bplist00":
+                binary_entries.append(filename)
+    assert len(binary_entries) == number, binary_entries
+
+
+@then('DayOne entry "{uuid}" should not exist')
+def check_no_dayone_entry(context, uuid):
+    assert not os.path.exists(dayone_entry_file(uuid))
+
+
+@then('DayOne entry "{uuid}" should have the text "{text}"')
+def check_dayone_entry_text(context, uuid, text):
+    with open(dayone_entry_file(uuid), "rb") as f:
+        dict_entry = plistlib.load(f)
+    assert dict_entry["Entry Text"].strip() == text, dict_entry["Entry Text"]
@@ -1,180 +1,353 @@
 #!/usr/bin/env python
 
-from datetime import datetime
-import fnmatch
+import base64
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from io import BytesIO
 import os
-from pathlib import Path
+import pickle
 import plistlib
 import re
-import time
 import uuid
-from xml.parsers.expat import ExpatError
+from xml.parsers.expat import ExpatError, ParserCreate
 import socket
 import platform
 
 import pytz
 import tzlocal
+import xdg.BaseDirectory
 
 from . import __title__, __version__, Entry, Journal
 from . import time as jrnl_time
 
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
+# Key order of the plists written by DayOne.write
+_ENTRY_PLIST_TEMPLATE = dict.fromkeys(
+    ("Creation Date", "Starred", "Entry Text", "Time Zone", "UUID", "Tags", "Creator")
+)
+_CREATOR_TEMPLATE = dict.fromkeys(
+    ("Device Agent", "Generation Date", "Host Name", "OS Agent", "Software Agent")
+)
+_DATE_BLOB_RE = re.compile(r"^\[[^\]]+\] ")
+
+
+def _parse_uuid_line(line):
+    """Returns the lower cased UUID if line looks like '# <uuid>', None otherwise"""
+    if not line.startswith("#"):
+        return None
+    uuid_hex = line[1:].strip(" ")
+    if uuid_hex and _HEX_DIGITS.issuperset(uuid_hex):
+        return uuid_hex.lower()
+    return None
+
+
+def _plist_value(element):
+    """Converts an lxml element of an XML plist into the matching Python object,
+    following the same rules as plistlib's own XML parser"""
+    tag = element.tag
+    if tag == "dict":
+        children = list(element)
+        if len(children) % 2:
+            raise plistlib.InvalidFileException()
+        result = {}
+        for key, value in zip(children[::2], children[1::2]):
+            if key.tag != "key":
+                raise plistlib.InvalidFileException()
+            result[key.text or ""] = _plist_value(value)
+        return result
+    if tag == "array":
+        return [_plist_value(child) for child in element]
+    if tag == "string":
+        return element.text or ""
+    if tag == "integer":
+        raw = element.text or ""
+        if raw.startswith("0x") or raw.startswith("0X"):
+            return int(raw, 16)
+        return int(raw)
+    if tag == "real":
+        return float(element.text or "")
+    if tag == "true":
+        return True
+    if tag == "false":
+        return False
+    if tag == "date":
+        return plistlib._date_from_string(element.text or "")
+    if tag == "data":
+        return base64.b64decode(element.text or "")
+    raise plistlib.InvalidFileException()
+
+
+class _BufferedPlistParser(plistlib._PlistParser):
+    """plistlib's XML parser with expat's character data buffering turned on,
+    so long strings are handed to Python in one piece instead of line by line"""
+
+    def parse(self, fileobj):
+        self.parser = ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.handle_begin_element
+        self.parser.EndElementHandler = self.handle_end_element
+        self.parser.CharacterDataHandler = self.handle_data
+        self.parser.EntityDeclHandler = self.handle_entity_decl
+        self.parser.ParseFile(fileobj)
+        return self.root
+
+
+def _plist_loads(data):
+    """Loads a plist from bytes. Binary plists are handed to plistlib, XML
+    plists are parsed with lxml if it is installed and with a buffered
+    plistlib parser otherwise."""
+    if data.startswith(b"bplist00"):
+        return plistlib.loads(data, fmt=plistlib.FMT_BINARY)
+    if etree is None:
+        try:
+            parser = _BufferedPlistParser(dict_type=dict)
+        except TypeError:
+            # Python < 3.9 also expects use_builtin_types
+            parser = _BufferedPlistParser(use_builtin_types=True, dict_type=dict)
+        return parser.parse(BytesIO(data))
+    # huge_tree lifts lxml's 10 MB limit on text nodes, which plistlib lacks
+    parser = etree.XMLParser(
+        remove_comments=True, remove_pis=True, resolve_entities=False, huge_tree=True
+    )
+    root = etree.fromstring(data, parser)
+    if root.tag != "plist" or len(root) != 1:
+        raise plistlib.InvalidFileException()
+    return _plist_value(root[0])
+
+
+def _iter_doentries(root):
+    """Recursively yields os.DirEntry objects for all .doentry files below root"""
+    with os.scandir(root) as it:
+        for dir_entry in it:
+            if dir_entry.is_dir(follow_symlinks=False):
+                yield from _iter_doentries(dir_entry.path)
+            elif dir_entry.name.endswith(".doentry"):
+                yield dir_entry
+
+
+def _safe_unlink(path):
+    """Removes path, ignoring files that are already gone"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
 
 class DayOne(Journal.Journal):
     """A special Journal handling DayOne files"""
 
     # InvalidFileException was added to plistlib in Python3.4
     PLIST_EXCEPTIONS = (
-        (ExpatError, plistlib.InvalidFileException)
+        (ExpatError, ValueError, plistlib.InvalidFileException)
         if hasattr(plistlib, "InvalidFileException")
-        else ExpatError
+        else (ExpatError, ValueError)
     )
+    if etree is not None:
+        PLIST_EXCEPTIONS += (etree.XMLSyntaxError,)
 
     def __init__(self, **kwargs):
         self.entries = []
         self._deleted_entries = []
+        # Entries that need to be written, in the order they were changed
+        self._dirty = []
         super().__init__(**kwargs)
+        self.config.setdefault("binary_plists", False)
+        self.config.setdefault("cache_plists", False)
 
     def open(self):
-        filenames = [
-            os.path.join(self.config["journal"], "entries", f)
-            for f in os.listdir(os.path.join(self.config["journal"], "entries"))
+        tag_prefix = self.config["tagsymbols"][0]
+        use_cache = self.config["cache_plists"]
+        cached_plists = self._read_cache() if use_cache else {}
+        plists = {}
+        misses = []
+        for dir_entry in _iter_doentries(self.config["journal"]):
+            stat = dir_entry.stat()
+            key = (stat.st_mtime_ns, stat.st_size)
+            cached = cached_plists.get(dir_entry.path)
+            if cached and cached[0] == key:
+                plists[dir_entry.path] = cached
+            else:
+                misses.append((dir_entry.path, key))
+
+        if misses:
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                filenames = [filename for filename, key in misses]
+                loaded = executor.map(self._load_plist, filenames)
+                for (filename, key), dict_entry in zip(misses, loaded):
+                    plists[filename] = (key, dict_entry)
+        if use_cache and (misses or len(plists) != len(cached_plists)):
+            self._write_cache(plists)
+
+        tz_cache = {}
+        self.entries = [
+            self._entry_from_plist(dict_entry, tag_prefix, tz_cache)
+            for key, dict_entry in plists.values()
+            if dict_entry is not None
         ]
-        filenames = []
-        for root, dirnames, f in os.walk(self.config["journal"]):
-            for filename in fnmatch.filter(f, "*.doentry"):
-                filenames.append(os.path.join(root, filename))
-        self.entries = []
-        for filename in filenames:
-            with open(filename, "rb") as plist_entry:
-                try:
-                    dict_entry = plistlib.load(plist_entry, fmt=plistlib.FMT_XML)
-                except self.PLIST_EXCEPTIONS:
-                    pass
-                else:
-                    try:
-                        timezone = pytz.timezone(dict_entry["Time Zone"])
-                    except (KeyError, pytz.exceptions.UnknownTimeZoneError):
-                        timezone = tzlocal.get_localzone()
-                    date = dict_entry["Creation Date"]
-                    # convert the date to UTC rather than keep messing with
-                    # timezones
-                    if timezone.zone != "UTC":
-                        date = date + timezone.utcoffset(date, is_dst=False)
-
-                    entry = Entry.Entry(
-                        self,
-                        date,
-                        text=dict_entry["Entry Text"],
-                        starred=dict_entry["Starred"],
-                    )
-                    entry.uuid = dict_entry["UUID"]
-                    entry._tags = [
-                        self.config["tagsymbols"][0] + tag.lower()
-                        for tag in dict_entry.get("Tags", [])
-                    ]
-
-                    """Extended DayOne attributes"""
-                    try:
-                        entry.creator_device_agent = dict_entry["Creator"][
-                            "Device Agent"
-                        ]
-                    except:
-                        pass
-                    try:
-                        entry.creator_generation_date = dict_entry["Creator"][
-                            "Generation Date"
-                        ]
-                    except:
-                        entry.creator_generation_date = date
-                    try:
-                        entry.creator_host_name = dict_entry["Creator"]["Host Name"]
-                    except:
-                        pass
-                    try:
-                        entry.creator_os_agent = dict_entry["Creator"]["OS Agent"]
-                    except:
-                        pass
-                    try:
-                        entry.creator_software_agent = dict_entry["Creator"][
-                            "Software Agent"
-                        ]
-                    except:
-                        pass
-                    try:
-                        entry.location = dict_entry["Location"]
-                    except:
-                        pass
-                    try:
-                        entry.weather = dict_entry["Weather"]
-                    except:
-                        pass
-                    self.entries.append(entry)
         self.sort()
         return self
 
+    def _cache_file(self):
+        """Returns the path of the file caching this journal's parsed plists"""
+        journal_path = os.path.abspath(self.config["journal"])
+        journal_hash = hashlib.sha1(journal_path.encode("utf-8")).hexdigest()
+        return os.path.join(
+            xdg.BaseDirectory.xdg_cache_home, __title__, journal_hash + ".pkl"
+        )
+
+    def _read_cache(self):
+        """Returns a dict mapping .doentry paths to ((mtime, size), plist) as
+        saved by the last call to open. Returns an empty dict if there's no
+        usable cache."""
+        try:
+            with open(self._cache_file(), "rb") as f:
+                cached_plists = pickle.load(f)
+        except Exception:
+            # A missing or broken cache is simply rebuilt
+            return {}
+        return cached_plists if isinstance(cached_plists, dict) else {}
+
+    def _write_cache(self, plists):
+        cache_file = self._cache_file()
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(cache_file + ".tmp", "wb") as f:
+                pickle.dump(plists, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_file + ".tmp", cache_file)
+        except OSError:
+            pass
+
+    def _load_plist(self, filename):
+        """Loads a single .doentry file. Returns None if the file is not a
+        valid plist."""
+        with open(filename, "rb") as plist_entry:
+            data = plist_entry.read()
+        try:
+            return _plist_loads(data)
+        except self.PLIST_EXCEPTIONS:
+            return None
+
+    def _entry_from_plist(self, dict_entry, tag_prefix, tz_cache):
+        """Turns the contents of a .doentry file into an Entry. tz_cache maps
+        time zone names to the zones already looked up for them."""
+        tz_name = dict_entry.get("Time Zone")
+        timezone = tz_cache.get(tz_name)
+        if timezone is None:
+            try:
+                timezone = pytz.timezone(tz_name)
+            except pytz.exceptions.UnknownTimeZoneError:
+                timezone = tzlocal.get_localzone()
+            tz_cache[tz_name] = timezone
+        date = dict_entry["Creation Date"]
+        # convert the date to UTC rather than keep messing with
+        # timezones
+        if timezone is not pytz.utc:
+            date = date + timezone.utcoffset(date, is_dst=False)
+
+        entry = Entry.Entry(
+            self, date, text=dict_entry["Entry Text"], starred=dict_entry["Starred"],
+        )
+        entry.uuid = dict_entry["UUID"]
+        entry._tags = [tag_prefix + tag.lower() for tag in dict_entry.get("Tags", [])]
+
+        """Extended DayOne attributes"""
+        creator = dict_entry.get("Creator") or {}
+        if "Device Agent" in creator:
+            entry.creator_device_agent = creator["Device Agent"]
+        entry.creator_generation_date = creator.get("Generation Date", date)
+        if "Host Name" in creator:
+            entry.creator_host_name = creator["Host Name"]
+        if "OS Agent" in creator:
+            entry.creator_os_agent = creator["OS Agent"]
+        if "Software Agent" in creator:
+            entry.creator_software_agent = creator["Software Agent"]
+        if "Location" in dict_entry:
+            entry.location = dict_entry["Location"]
+        if "Weather" in dict_entry:
+            entry.weather = dict_entry["Weather"]
+        return entry
+
     def write(self):
         """Writes only the entries that have been modified into plist files."""
-        for entry in self.entries:
-            if entry.modified:
-                utc_time = datetime.utcfromtimestamp(
-                    time.mktime(entry.date.timetuple())
-                )
-
-                if not hasattr(entry, "uuid"):
-                    entry.uuid = uuid.uuid1().hex
-                if not hasattr(entry, "creator_device_agent"):
-                    entry.creator_device_agent = ""  # iPhone/iPhone5,3
-                if not hasattr(entry, "creator_generation_date"):
-                    entry.creator_generation_date = utc_time
-                if not hasattr(entry, "creator_host_name"):
-                    entry.creator_host_name = socket.gethostname()
-                if not hasattr(entry, "creator_os_agent"):
-                    entry.creator_os_agent = "{}/{}".format(
-                        platform.system(), platform.release()
-                    )
-                if not hasattr(entry, "creator_software_agent"):
-                    entry.creator_software_agent = "{}/{}".format(
-                        __title__, __version__
-                    )
+        plist_format = (
+            plistlib.FMT_BINARY if self.config["binary_plists"] else plistlib.FMT_XML
+        )
+        entries_dir = os.path.join(self.config["journal"], "entries")
+        tagsymbols = self.config["tagsymbols"]
+        host_name = socket.gethostname()
+        os_agent = "{}/{}".format(platform.system(), platform.release())
+        software_agent = "{}/{}".format(__title__, __version__)
+        plist_template = _ENTRY_PLIST_TEMPLATE.copy()
+        plist_template["Time Zone"] = str(tzlocal.get_localzone())
+        for entry in self._dirty:
+            # naive dates are in local time, which astimezone assumes too
+            utc_time = entry.date.astimezone(pytz.utc).replace(
+                tzinfo=None, microsecond=0
+            )
 
-                fn = (
-                    Path(self.config["journal"])
-                    / "entries"
-                    / (entry.uuid.upper() + ".doentry")
-                )
-
-                entry_plist = {
-                    "Creation Date": utc_time,
-                    "Starred": entry.starred if hasattr(entry, "starred") else False,
-                    "Entry Text": entry.title + "\n" + entry.body,
-                    "Time Zone": str(tzlocal.get_localzone()),
-                    "UUID": entry.uuid.upper(),
-                    "Tags": [
-                        tag.strip(self.config["tagsymbols"]).replace("_", " ")
-                        for tag in entry.tags
-                    ],
-                    "Creator": {
-                        "Device Agent": entry.creator_device_agent,
-                        "Generation Date": entry.creator_generation_date,
-                        "Host Name": entry.creator_host_name,
-                        "OS Agent": entry.creator_os_agent,
-                        "Software Agent": entry.creator_software_agent,
-                    },
-                }
-                if hasattr(entry, "location"):
-                    entry_plist["Location"] = entry.location
-                if hasattr(entry, "weather"):
-                    entry_plist["Weather"] = entry.weather
-
-                # plistlib expects a binary object
-                with fn.open(mode="wb") as f:
-                    plistlib.dump(entry_plist, f, fmt=plistlib.FMT_XML, sort_keys=False)
-
-        for entry in self._deleted_entries:
-            filename = os.path.join(
-                self.config["journal"], "entries", entry.uuid + ".doentry"
+            if not hasattr(entry, "uuid"):
+                entry.uuid = uuid.uuid1().hex
+            if not hasattr(entry, "creator_device_agent"):
+                entry.creator_device_agent = ""  # iPhone/iPhone5,3
+            if not hasattr(entry, "creator_generation_date"):
+                entry.creator_generation_date = utc_time
+            if not hasattr(entry, "creator_host_name"):
+                entry.creator_host_name = host_name
+            if not hasattr(entry, "creator_os_agent"):
+                entry.creator_os_agent = os_agent
+            if not hasattr(entry, "creator_software_agent"):
+                entry.creator_software_agent = software_agent
+
+            fn = os.path.join(entries_dir, entry.uuid.upper() + ".doentry")
+
+            creator = _CREATOR_TEMPLATE.copy()
+            creator["Device Agent"] = entry.creator_device_agent
+            creator["Generation Date"] = entry.creator_generation_date
+            creator["Host Name"] = entry.creator_host_name
+            creator["OS Agent"] = entry.creator_os_agent
+            creator["Software Agent"] = entry.creator_software_agent
+
+            entry_plist = plist_template.copy()
+            entry_plist["Creation Date"] = utc_time
+            entry_plist["Starred"] = (
+                entry.starred if hasattr(entry, "starred") else False
             )
-            os.remove(filename)
+            entry_plist["Entry Text"] = entry.title + "\n" + entry.body
+            entry_plist["UUID"] = entry.uuid.upper()
+            entry_plist["Tags"] = [
+                tag.strip(tagsymbols).replace("_", " ") for tag in entry.tags
+            ]
+            entry_plist["Creator"] = creator
+            if hasattr(entry, "location"):
+                entry_plist["Location"] = entry.location
+            if hasattr(entry, "weather"):
+                entry_plist["Weather"] = entry.weather
+
+            # Serialise first so the file is written in one go rather than
+            # in the many small writes plistlib.dump makes
+            data = plistlib.dumps(entry_plist, fmt=plist_format, sort_keys=False)
+            with open(fn, "wb") as f:
+                f.write(data)
+
+        if self._deleted_entries:
+            filenames = [
+                os.path.join(entries_dir, entry.uuid.upper() + ".doentry")
+                for entry in self._deleted_entries
+            ]
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(_safe_unlink, filenames))
+        self._dirty = []
+
+    def new_entry(self, raw, date=None, sort=True):
+        entry = super().new_entry(raw, date=date, sort=sort)
+        self._dirty.append(entry)
+        return entry
 
     def editable_str(self):
         """Turns the journal into a string of entries that can be edited
@@ -191,48 +364,56 @@ class DayOne(Journal.Journal):
         # Initialise our current entry
         entries = []
         current_entry = None
+        current_title = ""
+        current_body_parts = []
 
         for line in edited.splitlines():
             # try to parse line as UUID => new entry begins
             line = line.rstrip()
-            m = re.match("# *([a-f0-9]+) *$", line.lower())
-            if m:
+            entry_uuid = _parse_uuid_line(line)
+            if entry_uuid:
                 if current_entry:
+                    current_entry.text = (
+                        current_title + "\n" + "\n".join(current_body_parts) + "\n"
+                    )
                     entries.append(current_entry)
                 current_entry = Entry.Entry(self)
                 current_entry.modified = False
-                current_entry.uuid = m.group(1).lower()
+                current_entry.uuid = entry_uuid
+                current_title = ""
+                current_body_parts = []
             else:
-                date_blob_re = re.compile("^\\[[^\\]]+\\] ")
-                date_blob = date_blob_re.findall(line)
-                if date_blob:
-                    date_blob = date_blob[0]
+                date_match = _DATE_BLOB_RE.match(line)
+                if date_match:
+                    date_blob = date_match.group()
                     new_date = jrnl_time.parse(date_blob.strip(" []"))
                     if line.endswith("*"):
                         current_entry.starred = True
                         line = line[:-1]
-                    current_entry.title = line[len(date_blob) - 1 :].strip()
+                    current_title = line[len(date_blob) - 1 :].strip()
                     current_entry.date = new_date
                 elif current_entry:
-                    current_entry.body += line + "\n"
+                    current_body_parts.append(line)
 
         # Append last entry
         if current_entry:
+            current_entry.text = (
+                current_title + "\n" + "\n".join(current_body_parts) + "\n"
+            )
             entries.append(current_entry)
 
         # Now, update our current entries if they changed
+        existing = {e.uuid.lower(): e for e in reversed(self.entries)}
         for entry in entries:
             entry._parse_text()
-            matched_entries = [
-                e for e in self.entries if e.uuid.lower() == entry.uuid.lower()
-            ]
+            match = existing.get(entry.uuid.lower())
             # tags in entry body
-            if matched_entries:
+            if match:
                 # This entry is an existing entry
-                match = matched_entries[0]
 
-                # merge existing tags with tags pulled from the entry body
-                entry.tags = list(set(entry.tags + match.tags))
+                # merge existing tags with tags pulled from the entry body,
+                # sorted so that they are written in the same order every time
+                entry._tags = sorted(set(entry.tags) | set(match.tags))
 
                 # extended Dayone metadata
                 if hasattr(match, "creator_device_agent"):
@@ -253,13 +434,20 @@ class DayOne(Journal.Journal):
                 if match != entry:
                     self.entries.remove(match)
                     entry.modified = True
+                    self._dirty.append(entry)
                     self.entries.append(entry)
+                    existing[entry.uuid.lower()] = entry
             else:
                 # This entry seems to be new... save it.
                 entry.modified = True
+                self._dirty.append(entry)
                 self.entries.append(entry)
+                existing[entry.uuid.lower()] = entry
         # Remove deleted entries
-        edited_uuids = [e.uuid for e in entries]
-        self._deleted_entries = [e for e in self.entries if e.uuid not in edited_uuids]
-        self.entries[:] = [e for e in self.entries if e.uuid in edited_uuids]
+        edited_uuids = {e.uuid.lower() for e in entries}
+        kept, deleted = [], []
+        for e in self.entries:
+            (kept if e.uuid.lower() in edited_uuids else deleted).append(e)
+        self._deleted_entries = deleted
+        self.entries[:] = kept
         return entries
@@ -9,6 +9,26 @@ from .util import colorize, highlight_tags_with_background_color, split_title
 
 
 class Entry:
+    __slots__ = (
+        "journal",
+        "date",
+        "text",
+        "_title",
+        "_body",
+        "_tags",
+        "starred",
+        "modified",
+        # Only set on entries of DayOne journals
+        "uuid",
+        "creator_device_agent",
+        "creator_generation_date",
+        "creator_host_name",
+        "creator_os_agent",
+        "creator_software_agent",
+        "location",
+        "weather",
+    )
+
     def __init__(self, journal, date=None, text="", starred=False):
         self.journal = journal  # Reference to journal mainly to access its config
         self.date = date or datetime.now()
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+import plistlib
+
+import pytest
+
+from jrnl import DayOneJournal
+
+JOURNALS_DIR = Path(__file__).parent.parent / "features" / "data" / "journals"
+DOENTRY_FILES = sorted(JOURNALS_DIR.glob("*.dayone/entries/*.doentry"))
+
+PLIST_TEMPLATE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0">
+<dict>
+%s
+</dict>
+</plist>
+"""
+
+ODD_PLIST = PLIST_TEMPLATE % (
+    b"""
+    <key>Decimal</key>
+    <integer>010</integer>
+    <key>Hex</key>
+    <integer>0x1F</integer>
+    <key>No Seconds</key>
+    <date>2013-01-17T18:37Z</date>
+"""
+)
+
+ODD_PLISTS = [
+    ODD_PLIST,
+    PLIST_TEMPLATE % b"<key>Empty Real</key><real/>",
+    PLIST_TEMPLATE % b"<string>Not A Key</string><string>Value</string>",
+    PLIST_TEMPLATE % b"<key>Missing Value</key>",
+    PLIST_TEMPLATE % b"<key>Huge</key><string>%s</string>" % (b"x" * 11 * 1024 * 1024),
+]
+
+
+def read_plist(filename):
+    with open(filename, "rb") as f:
+        return f.read()
+
+
+def plist_or_exception(loads, data):
+    try:
+        return loads(data)
+    except DayOneJournal.DayOne.PLIST_EXCEPTIONS:
+        return DayOneJournal.DayOne.PLIST_EXCEPTIONS
+
+
+@pytest.mark.parametrize("filename", DOENTRY_FILES)
+def test_lxml_parser_matches_plistlib(filename):
+    pytest.importorskip("lxml")
+    data = read_plist(filename)
+    assert plist_or_exception(DayOneJournal._plist_loads, data) == plist_or_exception(
+        plistlib.loads, data
+    )
+
+
+@pytest.mark.parametrize(
+    "data",
+    ODD_PLISTS,
+    ids=["odd-values", "empty-real", "non-key", "missing-value", "huge-string"],
+)
+def test_lxml_parser_matches_plistlib_on_odd_values(data):
+    pytest.importorskip("lxml")
+    assert plist_or_exception(DayOneJournal._plist_loads, data) == plist_or_exception(
+        plistlib.loads, data
+    )
+
+
+def test_unreadable_values_skip_the_entry(tmp_path):
+    filename = tmp_path / "broken.doentry"
+    filename.write_bytes(ODD_PLIST.replace(b"<integer>010", b"<integer>ten"))
+    journal = DayOneJournal.DayOne(journal=str(tmp_path))
+    assert journal._load_plist(str(filename)) is None
+
+
+@pytest.mark.parametrize("filename", DOENTRY_FILES)
+def test_fallback_parser_is_used_without_lxml(filename, monkeypatch):
+    monkeypatch.setattr(DayOneJournal, "etree", None)
+    calls = []
+    parse = DayOneJournal._BufferedPlistParser.parse
+
+    def counting_parse(self, fileobj):
+        calls.append(fileobj)
+        return parse(self, fileobj)
+
+    monkeypatch.setattr(DayOneJournal._BufferedPlistParser, "parse", counting_parse)
+    data = read_plist(filename)
+    assert plist_or_exception(DayOneJournal._plist_loads, data) == plist_or_exception(
+        plistlib.loads, data
+    )
+    assert len(calls) == 1
+
+
+def test_utc_offsets_are_looked_up_per_entry(tmp_path):
+    # Lord Howe Island moves its clocks back by half an hour, so entries
+    # written within the same hour can have different UTC offsets
+    journal = DayOneJournal.DayOne(journal=str(tmp_path))
+    tz_cache = {}
+    dates = []
+    for minute in (0, 30):
+        dict_entry = {
+            "Creation Date": datetime(2020, 4, 5, 1, minute),
+            "Entry Text": "Clocks go back.",
+            "Starred": False,
+            "Time Zone": "Australia/Lord_Howe",
+            "UUID": f"{minute:032X}",
+        }
+        dates.append(journal._entry_from_plist(dict_entry, "@", tz_cache).date)
+    assert dates == [
+        datetime(2020, 4, 5, 1, 0) + timedelta(hours=11),
+        datetime(2020, 4, 5, 1, 30) + timedelta(hours=10, minutes=30),
+    ]